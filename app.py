@@ -5,13 +5,15 @@ Production-ready TTS microservice for HOLLY AI
 """
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import Optional
+import asyncio
 import os
-import io
-import soundfile as sf
+import threading
+import struct
+import numpy as np
 
 from holly_voice_generator import HollyVoiceGenerator, HOLLY_VOICE_DESCRIPTION
 
@@ -31,18 +33,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global voice generator (lazy load)
+# Global voice generator (preloaded on startup, lazy fallback)
 voice_generator: Optional[HollyVoiceGenerator] = None
+voice_generator_lock = threading.Lock()
+preload_task: Optional[asyncio.Task] = None
+preload_error: Optional[Exception] = None  # Why the startup preload failed, reported by /ready
+
+# Maya1 runs as a single worker: queue GPU work here instead of inside CUDA
+gpu_semaphore = asyncio.Semaphore(1)
+
+SAMPLE_RATE = 24000
+
+# Micro-batching of concurrent generation requests
+BATCH_WINDOW_SECONDS = 0.02  # How long to wait for more requests to join a batch
+MAX_BATCH_SIZE = 8
+LENGTH_BUCKET_TOKENS = 32  # Group requests whose prompt lengths round to the same bucket
+batch_queue: Optional[asyncio.Queue] = None
+batch_worker_task: Optional[asyncio.Task] = None
+stream_tasks: set = set()  # Strong references to running produce_wav_chunks tasks
 
 
 def get_generator() -> HollyVoiceGenerator:
     """Get or initialize the voice generator"""
     global voice_generator
     if voice_generator is None:
-        voice_generator = HollyVoiceGenerator()
+        # Only one caller loads the model, concurrent callers wait for it
+        with voice_generator_lock:
+            if voice_generator is None:
+                voice_generator = HollyVoiceGenerator(
+                    quantization=os.environ.get("HOLLY_QUANTIZATION", "none"),
+                    backend=os.environ.get("HOLLY_LM_BACKEND", "auto")
+                )
     return voice_generator
 
 
+async def preload_generator():
+    """Load and warm up the model in the background so /health stays responsive"""
+    global preload_error
+    try:
+        await asyncio.to_thread(get_generator)
+        print("✅ HOLLY voice model loaded and warmed up")
+    except Exception as e:
+        preload_error = e
+        print(f"⚠️  Model preload failed: {e}")
+
+
+def wav_header(num_samples: Optional[int] = None) -> bytes:
+    """
+    Build the 44-byte header for 16-bit mono PCM WAV at 24kHz
+    
+    Pass num_samples=None for a streaming header with unknown (maximum) length
+    """
+    if num_samples is None:
+        riff_size = data_size = 0xFFFFFFFF
+    else:
+        data_size = num_samples * 2
+        riff_size = 36 + data_size
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', riff_size, b'WAVE',
+        b'fmt ', 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16,
+        b'data', data_size
+    )
+
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    """Convert float audio in [-1, 1] to little-endian int16 PCM bytes"""
+    return (np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes()
+
+
 class TTSRequest(BaseModel):
     """TTS generation request"""
     text: str = Field(..., description="Text to synthesize", min_length=1, max_length=5000)
@@ -52,6 +111,10 @@ class TTSRequest(BaseModel):
     )
     temperature: float = Field(0.4, ge=0.1, le=1.0, description="Sampling temperature")
     top_p: float = Field(0.9, ge=0.1, le=1.0, description="Nucleus sampling threshold")
+    stream: bool = Field(
+        False,
+        description="Stream WAV audio as it is generated instead of returning the complete file"
+    )
 
 
 class TTSResponse(BaseModel):
@@ -62,13 +125,176 @@ class TTSResponse(BaseModel):
     message: str
 
 
+def group_requests(generator: HollyVoiceGenerator, pending: list) -> dict:
+    """Bucket queued requests by rounded prompt length and sampling parameters"""
+    groups = {}
+    for item in pending:
+        text, description, temperature, top_p, _ = item
+        length = generator.prompt_length(text, description)
+        key = (round(length / LENGTH_BUCKET_TOKENS), temperature, top_p)
+        groups.setdefault(key, []).append(item)
+    return groups
+
+
+async def batch_worker():
+    """
+    Drain the batch queue, grouping similar requests into a single generate call
+    
+    A compiled model generates one row at a time, so with it requests are
+    taken one by one without waiting for a batch window.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        pending = [await batch_queue.get()]
+        try:
+            generator = await asyncio.to_thread(get_generator)
+        except Exception as e:
+            for *_, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        batch_size = 1 if generator.compiled else MAX_BATCH_SIZE
+        deadline = loop.time() + BATCH_WINDOW_SECONDS
+        while len(pending) < batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(await asyncio.wait_for(batch_queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            # Tokenizing runs off the event loop; a failure here fails only this window
+            groups = await asyncio.to_thread(group_requests, generator, pending)
+        except Exception as e:
+            for *_, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        for (_, temperature, top_p), items in groups.items():
+            try:
+                async with gpu_semaphore:
+                    audios = await asyncio.to_thread(
+                        generator.generate_batch,
+                        [item[0] for item in items],
+                        [item[1] for item in items],
+                        temperature=temperature,
+                        top_p=top_p
+                    )
+            except Exception as e:
+                for *_, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (*_, future), audio in zip(items, audios):
+                if future.done():
+                    continue
+                if isinstance(audio, Exception):
+                    future.set_exception(audio)
+                else:
+                    future.set_result(audio)
+
+
+async def produce_wav_chunks(chunks, stop: threading.Event, chunk_queue: asyncio.Queue):
+    """
+    Run a voice stream under the GPU semaphore, buffering its chunks in chunk_queue
+    
+    The semaphore is released as soon as generation ends, independent of how
+    fast (or whether) the client reads the response. The queue receives audio
+    chunks, then an exception if generation failed, then None.
+    """
+    try:
+        async with gpu_semaphore:
+            if stop.is_set():
+                return
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    break
+                chunk_queue.put_nowait(chunk)
+    except Exception as e:
+        chunk_queue.put_nowait(e)
+    finally:
+        chunk_queue.put_nowait(None)
+
+
+async def open_wav_stream(generator: HollyVoiceGenerator, request: TTSRequest) -> StreamingResponse:
+    """
+    Start a streaming WAV response fed by a background generation task
+    
+    The first chunk is generated before any headers go out, so a failure
+    becomes an error response instead of a 200 carrying only a WAV header.
+    """
+    stop = threading.Event()
+    chunks = generator.generate_stream(
+        text=request.text,
+        description=request.description,
+        temperature=request.temperature,
+        top_p=request.top_p,
+        stop_event=stop
+    )
+    chunk_queue = asyncio.Queue()
+    task = asyncio.create_task(produce_wav_chunks(chunks, stop, chunk_queue))
+    stream_tasks.add(task)
+    task.add_done_callback(stream_tasks.discard)
+    
+    try:
+        first = await chunk_queue.get()
+    except BaseException:
+        # Client went away before the first chunk: stop generating
+        stop.set()
+        raise
+    if isinstance(first, Exception):
+        raise first
+    if first is None:
+        raise RuntimeError("Voice stream ended without audio")
+    
+    async def body():
+        try:
+            yield wav_header()
+            chunk = first
+            while chunk is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield to_pcm16(chunk)
+                chunk = await chunk_queue.get()
+        finally:
+            # Stops generation if the client disconnected mid-stream
+            stop.set()
+    
+    return StreamingResponse(
+        body(),
+        media_type="audio/wav",
+        headers={
+            "Content-Disposition": "inline; filename=holly_speech.wav",
+            "X-Sample-Rate": "24000"
+        }
+    )
+
+
+async def generate_batched(request: TTSRequest):
+    """Queue a request for the batch worker and wait for its audio"""
+    future = asyncio.get_running_loop().create_future()
+    await batch_queue.put(
+        (request.text, request.description, request.temperature, request.top_p, future)
+    )
+    return await future
+
+
 @app.on_event("startup")
 async def startup_event():
     """Preload model on startup"""
+    global batch_queue, batch_worker_task, preload_task
     print("🚀 HOLLY TTS API starting up...")
-    # Optionally preload model here
-    # get_generator()
-    print("✅ HOLLY TTS API ready!")
+    batch_queue = asyncio.Queue()
+    batch_worker_task = asyncio.create_task(batch_worker())
+    # Load weights and capture the compiled graphs before traffic arrives
+    preload_task = asyncio.create_task(preload_generator())
+    print("✅ HOLLY TTS API accepting connections (model loading, see /ready)")
 
 
 @app.get("/")
@@ -89,12 +315,22 @@ async def health():
     return {"status": "healthy", "model_loaded": voice_generator is not None}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: succeeds once the model is loaded and warmed up"""
+    if voice_generator is None:
+        if preload_error is not None:
+            raise HTTPException(status_code=503, detail=f"Model failed to load: {preload_error}")
+        raise HTTPException(status_code=503, detail="Model is still loading")
+    return {"status": "ready", "model_loaded": True}
+
+
 @app.get("/cache/stats")
 async def cache_stats():
     """Get voice cache statistics"""
     try:
-        generator = get_generator()
-        stats = generator.get_cache_stats()
+        generator = await asyncio.to_thread(get_generator)
+        stats = await asyncio.to_thread(generator.get_cache_stats)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get cache stats: {str(e)}")
@@ -104,8 +340,8 @@ async def cache_stats():
 async def clear_cache():
     """Clear voice cache"""
     try:
-        generator = get_generator()
-        generator.clear_cache()
+        generator = await asyncio.to_thread(get_generator)
+        await asyncio.to_thread(generator.clear_cache)
         return {"success": True, "message": "Voice cache cleared"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to clear cache: {str(e)}")
@@ -116,24 +352,23 @@ async def generate_speech(request: TTSRequest):
     """
     Generate speech from text using HOLLY's voice
     
-    Returns WAV audio (24kHz, mono)
+    Returns WAV audio (24kHz, mono). Set stream=true to receive audio as it
+    is generated (no X-Duration-Seconds header, and no request batching).
+    
+    Audio is cached by normalized text and description (whitespace collapsed,
+    case-insensitive), so requests differing only in case or spacing return
+    the same cached audio.
     """
     try:
-        # Get generator
-        generator = get_generator()
+        if request.stream:
+            generator = await asyncio.to_thread(get_generator)
+            return await open_wav_stream(generator, request)
         
-        # Generate audio
-        audio = generator.generate(
-            text=request.text,
-            description=request.description,
-            temperature=request.temperature,
-            top_p=request.top_p
-        )
+        # Generate audio (batched with concurrent requests)
+        audio = await generate_batched(request)
         
-        # Convert to WAV bytes
-        wav_buffer = io.BytesIO()
-        sf.write(wav_buffer, audio, 24000, format='WAV')
-        wav_bytes = wav_buffer.getvalue()
+        # Convert to WAV bytes (header + int16 PCM, no libsndfile roundtrip)
+        wav_bytes = wav_header(len(audio)) + to_pcm16(audio)
         
         # Return audio
         return Response(
@@ -157,14 +392,7 @@ async def generate_speech_info(request: TTSRequest) -> TTSResponse:
     Useful for testing and monitoring
     """
     try:
-        generator = get_generator()
-        
-        audio = generator.generate(
-            text=request.text,
-            description=request.description,
-            temperature=request.temperature,
-            top_p=request.top_p
-        )
+        audio = await generate_batched(request)
         
         duration = len(audio) / 24000
         
@@ -209,5 +437,8 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=port,
         workers=1,  # Maya1 is memory-intensive, use 1 worker
-        log_level="info"
+        loop="uvloop",  # libuv event loop
+        http="httptools",  # C HTTP parser
+        log_level="info",
+        timeout_keep_alive=30
     )
@@ -4,16 +4,40 @@ HOLLY Voice Generator - Maya1 TTS Integration
 Self-hosted voice generation for HOLLY AI with emotional intelligence
 """
 
+import os
+
+# Persist Inductor's compiled graphs across restarts (must be set before torch import)
+os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", "/tmp/holly_inductor_cache")
+
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import torch._inductor.config
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    BitsAndBytesConfig,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    StaticCache,
+)
+from transformers.generation.streamers import BaseStreamer
 from snac import SNAC
 import soundfile as sf
 import numpy as np
-from typing import Optional, List
-import os
-import hashlib
+from typing import Optional, List, Iterator, Dict, Tuple, Union
+import xxhash
+import contextlib
+import queue
+import string
+from collections import OrderedDict
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    from vllm import LLM, SamplingParams
+except ImportError:  # Optional: install vllm to serve Maya1 with vLLM
+    LLM = None
+
 # Maya1 Token IDs
 CODE_START_TOKEN_ID = 128257
 CODE_END_TOKEN_ID = 128258
@@ -21,6 +45,7 @@ CODE_TOKEN_OFFSET = 128266
 SNAC_MIN_ID = 128266
 SNAC_MAX_ID = 156937
 SNAC_TOKENS_PER_FRAME = 7
+SNAC_SAMPLES_PER_FRAME = 2048  # 24kHz samples decoded from one 7-token frame
 
 SOH_ID = 128259
 EOH_ID = 128260
@@ -28,6 +53,30 @@ SOA_ID = 128261
 BOS_ID = 128000
 TEXT_EOT_ID = 128009
 
+# Static KV cache / torch.compile settings
+PROMPT_BUCKETS = (64, 128, 256)  # Pad prompts to these lengths to avoid recompiles
+MAX_CACHE_LENGTH = 2048 + PROMPT_BUCKETS[-1]  # Fixed KV cache: longest bucket + 2048 new tokens
+WARMUP_BUCKET_TOKENS = 16  # Decode graphs are shared, so extra buckets only need their prefill
+
+# In-memory LRU in front of the on-disk voice cache
+MAX_MEM_CACHE = 128
+CACHE_KEY_LENGTH = 16  # Hex digits in an xxh3_64 cache key
+LEGACY_CACHE_KEY_LENGTH = 32  # Hex digits in an old MD5 cache key (float32 format)
+
+# Streaming decode settings
+STREAM_CHUNK_FRAMES = 4  # Decode and emit once this many new frames (28 tokens) are available
+STREAM_CONTEXT_FRAMES = 4  # Already-emitted frames re-decoded as left context to avoid clicks
+STREAM_LOOKAHEAD_FRAMES = 2  # Newest frames held back as right context for the chunk boundary
+
+# SNAC decode runs on frame counts padded to these buckets (GPU) so shapes stay static
+SNAC_FRAME_BUCKETS = (8, 16, 32, 64, 128, 256, 512)
+MAX_AUDIO_SAMPLES = SNAC_FRAME_BUCKETS[-1] * SNAC_SAMPLES_PER_FRAME  # Pinned host buffer size
+
+# Traced SNAC decoder, reloaded on startup to skip re-tracing (one file per dtype)
+SNAC_TRACE_PATH = "/tmp/holly_snac_traced_{dtype}.pt"
+
+torch._inductor.config.fx_graph_cache = True
+
 # HOLLY's Signature Voice Profile
 HOLLY_VOICE_DESCRIPTION = (
     "Female voice in her 30s with an American accent. "
@@ -36,10 +85,65 @@ HOLLY_VOICE_DESCRIPTION = (
 )
 
 
+def _round_up_to_bucket(length: int, buckets: tuple) -> int:
+    """Round length up to the nearest bucket (multiples of the largest bucket beyond it)"""
+    for bucket in buckets:
+        if length <= bucket:
+            return bucket
+    step = buckets[-1]
+    return -(-length // step) * step
+
+
+class _TokenQueueStreamer(BaseStreamer):
+    """Collect generated token ids from model.generate into a thread-safe queue"""
+    
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.error: Optional[Exception] = None
+        self._prompt_seen = False
+    
+    def put(self, value):
+        # The first call carries the prompt, skip it
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        self.queue.put(value.reshape(-1).tolist())
+    
+    def end(self):
+        self.queue.put(None)
+    
+    def __iter__(self):
+        while True:
+            token_ids = self.queue.get()
+            if token_ids is None:
+                return
+            yield token_ids
+
+
+class _StopEvent(StoppingCriteria):
+    """Stop generation once the streaming consumer goes away"""
+    
+    def __init__(self, event: threading.Event):
+        self.event = event
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full(
+            (input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device
+        )
+
+
 class HollyVoiceGenerator:
     """Generate HOLLY's voice using Maya1 TTS"""
     
-    def __init__(self, model_name: str = "maya-research/maya1", enable_cache: bool = True):
+    def __init__(
+        self,
+        model_name: str = "maya-research/maya1",
+        enable_cache: bool = True,
+        compile_model: bool = True,
+        warmup_tokens: int = 2048,
+        quantization: Optional[str] = None,
+        backend: str = "auto"
+    ):
         print("🔧 Initializing HOLLY Voice Generator...")
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"   Device: {self.device}")
@@ -50,15 +154,38 @@ class HollyVoiceGenerator:
         if self.enable_cache:
             self.cache_dir.mkdir(exist_ok=True)
             print(f"🗄️  Voice cache enabled: {self.cache_dir}")
+        # Hot phrases stay in RAM as int16 PCM (cache key -> samples), LRU order
+        self._mem_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._mem_cache_lock = threading.Lock()
+        # Running disk-cache totals so /cache/stats never walks the directory
+        self._cache_stats_lock = threading.Lock()
+        self._cache_count, self._cache_bytes = self._scan_cache_dir(prune_legacy=self.enable_cache)
         
         # Load Maya1 model
-        print("📦 Loading Maya1 model...")
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            torch_dtype=torch.bfloat16,
-            device_map="auto",
-            trust_remote_code=True
-        )
+        self.backend = self._resolve_backend(backend, quantization)
+        self.model = None
+        self.engine = None
+        self.quantized = False
+        if self.backend == "vllm":
+            # Continuous batching, paged KV cache and fused attention kernels
+            print("📦 Loading Maya1 model (vLLM)...")
+            self.engine = LLM(
+                model=model_name,
+                dtype="bfloat16",
+                gpu_memory_utilization=0.7,
+                trust_remote_code=True
+            )
+        else:
+            print("📦 Loading Maya1 model...")
+            quantization_config = self._quantization_config(quantization)
+            self.quantized = quantization_config is not None
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype=torch.bfloat16,
+                device_map="auto",
+                trust_remote_code=True,
+                quantization_config=quantization_config
+            )
         
         self.tokenizer = AutoTokenizer.from_pretrained(
             model_name,
@@ -66,73 +193,262 @@ class HollyVoiceGenerator:
         )
         print(f"   ✅ Model loaded: {len(self.tokenizer)} tokens")
         
+        # Special-token prompt prefix/suffix, built once instead of per request.
+        # The leading ids include whatever the tokenizer adds itself (e.g. BOS).
+        self._prefix_ids = self.tokenizer("").input_ids + [SOH_ID, BOS_ID]
+        self._suffix_ids = [TEXT_EOT_ID, EOH_ID, SOA_ID, CODE_START_TOKEN_ID]
+        
+        self.pad_token_id = self.tokenizer.pad_token_id
+        if self.pad_token_id is None:
+            self.pad_token_id = self.tokenizer.eos_token_id
+        
+        # Every model.generate call runs on this one long-lived thread: Inductor's
+        # CUDA-graph trees are per-thread, so graphs captured during warmup are
+        # only replayed if later calls come from the same thread
+        self._gpu_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="holly-gpu")
+        
+        # Static KV cache + CUDA-graph compiled forward (GPU only)
+        self.compiled = compile_model and torch.cuda.is_available() and self.backend == "hf"
+        if self.compiled:
+            self._compile_model()
+        
         # Load SNAC audio decoder
         print("🎵 Loading SNAC audio decoder (24kHz)...")
         self.snac_model = SNAC.from_pretrained("hubertsiuzdak/snac_24khz").eval()
+        # bf16 halves decoder bandwidth and uses tensor cores on GPU
+        self.snac_dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
+        if torch.cuda.is_available():
+            self.snac_model = self.snac_model.to("cuda", dtype=self.snac_dtype)
+        self._load_traced_decoder()
+        # Separate stream so SNAC decode can overlap with token generation
+        self.decode_stream = torch.cuda.Stream() if torch.cuda.is_available() else None
+        # Reused pinned host buffer for async device-to-host audio copies
+        self._pinned_audio = (
+            torch.empty(MAX_AUDIO_SAMPLES, dtype=self.snac_dtype, pin_memory=True)
+            if torch.cuda.is_available() else None
+        )
+        # Captured SNAC decode per frame bucket: (graph, static code inputs, static audio output)
+        self._snac_graphs: Dict[int, Tuple[torch.cuda.CUDAGraph, List[torch.Tensor], torch.Tensor]] = {}
         if torch.cuda.is_available():
-            self.snac_model = self.snac_model.to("cuda")
+            self._capture_snac_graphs()
         print("   ✅ SNAC decoder loaded")
         
+        if self.compiled:
+            self._warmup(warmup_tokens)
+        
         print("✨ HOLLY Voice Generator ready!\n")
     
-    def build_prompt(self, description: str, text: str) -> str:
-        """Build formatted prompt for Maya1"""
-        soh_token = self.tokenizer.decode([SOH_ID])
-        eoh_token = self.tokenizer.decode([EOH_ID])
-        soa_token = self.tokenizer.decode([SOA_ID])
-        sos_token = self.tokenizer.decode([CODE_START_TOKEN_ID])
-        eot_token = self.tokenizer.decode([TEXT_EOT_ID])
-        bos_token = self.tokenizer.bos_token
+    def _resolve_backend(self, backend: str, quantization: Optional[str]) -> str:
+        """
+        Pick the LM engine: "vllm", "hf", or "auto"
         
-        formatted_text = f'<description="{description}"> {text}'
+        "auto" uses vLLM when it is installed, on GPU, and no bitsandbytes
+        quantization is requested (quantization is only wired up for "hf").
+        """
+        quantized = quantization not in (None, "none", "bf16")
+        if backend == "auto":
+            use_vllm = LLM is not None and torch.cuda.is_available() and not quantized
+            backend = "vllm" if use_vllm else "hf"
+        if backend == "vllm" and LLM is None:
+            raise ImportError("vLLM backend requested but vllm is not installed")
+        if backend == "vllm" and quantized:
+            raise ValueError(
+                f"Quantization {quantization!r} is not supported with the vLLM backend "
+                "(use backend \"hf\" or quantization \"none\")"
+            )
+        if backend not in ("vllm", "hf"):
+            raise ValueError(f"Unknown backend: {backend} (expected auto, vllm or hf)")
+        print(f"   Backend: {backend}")
+        return backend
+    
+    def _quantization_config(self, quantization: Optional[str]) -> Optional[BitsAndBytesConfig]:
+        """
+        Build the bitsandbytes config for Maya1 weights
+        
+        Decode is memory-bound, so smaller weights mean more tokens/sec.
+        "nf4" = 4-bit NF4, "int8" = 8-bit, None/"none"/"bf16" = unquantized bf16.
+        bitsandbytes needs CUDA, so CPU always loads bf16.
+        """
+        if quantization in (None, "none", "bf16") or not torch.cuda.is_available():
+            return None
+        
+        print(f"   Quantization: {quantization}")
+        if quantization == "nf4":
+            return BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_quant_type="nf4"
+            )
+        if quantization == "int8":
+            return BitsAndBytesConfig(load_in_8bit=True)
+        raise ValueError(f"Unknown quantization: {quantization} (expected nf4, int8 or none)")
+    
+    def _compile_model(self):
+        """Switch Maya1 to a static KV cache and compile its forward pass"""
+        print("⚙️  Compiling Maya1 forward (static cache, reduce-overhead)...")
+        torch._inductor.config.coordinate_descent_tuning = True
         
-        prompt = (
-            soh_token + bos_token + formatted_text + eot_token +
-            eoh_token + soa_token + sos_token
+        # One fixed-size cache for every call keeps the KV shapes (and graphs) constant
+        self._static_cache = StaticCache(
+            config=self.model.config,
+            max_batch_size=1,
+            max_cache_len=MAX_CACHE_LENGTH,
+            device=self.model.device,
+            dtype=self.model.dtype
+        )
+        # Kept for prompts too long for the fixed cache (see _model_generate)
+        self._eager_forward = self.model.forward
+        self.model.forward = torch.compile(
+            self.model.forward,
+            mode="reduce-overhead",
+            fullgraph=not self.quantized  # bitsandbytes kernels may graph-break
         )
+        self._compiled_forward = self.model.forward
+    
+    def _load_traced_decoder(self):
+        """Swap the SNAC decoder for a TorchScript trace, reusing the on-disk copy if present"""
+        trace_path = Path(SNAC_TRACE_PATH.format(dtype=str(self.snac_dtype).split(".")[-1]))
+        if trace_path.exists():
+            try:
+                self.snac_model.decoder = torch.jit.load(str(trace_path), map_location=self.device)
+                print(f"   ⚡ Traced SNAC decoder loaded: {trace_path}")
+                return
+            except Exception as e:
+                print(f"⚠️  Traced SNAC decoder load failed: {e}")
+        
+        try:
+            frames = 16
+            codes = [
+                torch.zeros(1, frames * n, dtype=torch.long, device=self.device)
+                for n in (1, 2, 4)
+            ]
+            with torch.no_grad():
+                z_q = self.snac_model.quantizer.from_codes(codes)
+                traced = torch.jit.trace(self.snac_model.decoder, z_q)
+            torch.jit.save(traced, str(trace_path))
+            self.snac_model.decoder = traced
+            print(f"   💾 SNAC decoder traced: {trace_path}")
+        except Exception as e:
+            print(f"⚠️  SNAC decoder trace failed, using eager decoder: {e}")
+    
+    def _warmup(self, max_tokens: int):
+        """Generate once per prompt bucket so every CUDA graph is captured up front"""
+        print(f"🔥 Warming up compiled model ({max_tokens} tokens)...")
+        prompt = self.encode_prompt(HOLLY_VOICE_DESCRIPTION, "Hello.")
+        for i, bucket in enumerate(PROMPT_BUCKETS):
+            if len(prompt) > bucket:
+                continue
+            # The first run captures the full decode loop; later buckets only add a prefill
+            tokens = max_tokens if i == 0 else min(max_tokens, WARMUP_BUCKET_TOKENS)
+            self._gpu_worker.submit(
+                self._model_generate,
+                self._prepare_inputs([prompt], length=bucket),
+                max_new_tokens=tokens,
+                min_new_tokens=tokens,
+                do_sample=True,
+                pad_token_id=self.pad_token_id,
+            ).result()
+            print(f"   Prompt bucket {bucket} ready")
+        print("   ✅ Warmup complete")
+    
+    def _model_generate(self, inputs: dict, **generate_kwargs) -> torch.Tensor:
+        """model.generate under inference mode (only ever called on the GPU worker thread)"""
+        if not self.compiled:
+            with torch.inference_mode():
+                return self.model.generate(**inputs, **generate_kwargs)
+        
+        prompt_length = inputs["input_ids"].shape[1]
+        available = MAX_CACHE_LENGTH - prompt_length
+        if available < generate_kwargs.get("min_new_tokens", 1):
+            # Too long for the fixed cache: run the eager forward with a dynamic cache
+            # (swapping forward is safe, only the GPU worker thread calls generate)
+            print(f"⚠️  Prompt of {prompt_length} tokens exceeds the static cache, generating uncompiled")
+            self.model.forward = self._eager_forward
+            try:
+                with torch.inference_mode():
+                    return self.model.generate(**inputs, **generate_kwargs)
+            finally:
+                self.model.forward = self._compiled_forward
+        
+        # Reuse the fixed cache, clamping the request so prompt + output fits in it
+        if generate_kwargs["max_new_tokens"] > available:
+            print(
+                f"⚠️  Prompt of {prompt_length} tokens leaves room for {available} of "
+                f"{generate_kwargs['max_new_tokens']} requested new tokens"
+            )
+            generate_kwargs["max_new_tokens"] = available
+        self._static_cache.reset()
+        generate_kwargs["past_key_values"] = self._static_cache
+        with torch.inference_mode():
+            return self.model.generate(**inputs, **generate_kwargs)
+    
+    def _prepare_inputs(self, prompts: List[List[int]], length: Optional[int] = None) -> dict:
+        """Left-pad prompt token ids into a batch (bucketed when the model is compiled)"""
+        if length is None:
+            length = max(len(ids) for ids in prompts)
+            if self.compiled:
+                length = _round_up_to_bucket(length, PROMPT_BUCKETS)
+        
+        input_ids = torch.full((len(prompts), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(prompts), length), dtype=torch.long)
+        for row, ids in enumerate(prompts):
+            input_ids[row, length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, length - len(ids):] = 1
         
-        return prompt
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if torch.cuda.is_available():
+            inputs = {k: v.to("cuda") for k, v in inputs.items()}
+        return inputs
+    
+    def prompt_length(self, text: str, description: Optional[str] = None) -> int:
+        """Number of prompt tokens for a request (used to group requests into batches)"""
+        if description is None:
+            description = HOLLY_VOICE_DESCRIPTION
+        return len(self.encode_prompt(description, text))
+    
+    def encode_prompt(self, description: str, text: str) -> List[int]:
+        """Build the Maya1 prompt token ids, tokenizing only the description and text"""
+        formatted_text = f'<description="{description}"> {text}'
+        body_ids = self.tokenizer(formatted_text, add_special_tokens=False).input_ids
+        return self._prefix_ids + body_ids + self._suffix_ids
     
-    def extract_snac_codes(self, token_ids: List[int]) -> List[int]:
+    def extract_snac_codes(self, token_ids) -> np.ndarray:
         """Extract SNAC codes from generated tokens"""
-        try:
-            eos_idx = token_ids.index(CODE_END_TOKEN_ID)
-        except ValueError:
-            eos_idx = len(token_ids)
+        ids = np.asarray(token_ids, dtype=np.int64)
         
-        snac_codes = [
-            token_id for token_id in token_ids[:eos_idx]
-            if SNAC_MIN_ID <= token_id <= SNAC_MAX_ID
-        ]
+        is_eos = ids == CODE_END_TOKEN_ID
+        eos_idx = int(np.argmax(is_eos)) if is_eos.any() else len(ids)
+        ids = ids[:eos_idx]
         
-        return snac_codes
+        return ids[(ids >= SNAC_MIN_ID) & (ids <= SNAC_MAX_ID)]
     
-    def unpack_snac_from_7(self, snac_tokens: List[int]) -> List[List[int]]:
+    def unpack_snac_from_7(self, snac_tokens) -> List[np.ndarray]:
         """Unpack 7-token SNAC frames to 3 hierarchical levels"""
-        if snac_tokens and snac_tokens[-1] == CODE_END_TOKEN_ID:
+        if len(snac_tokens) and snac_tokens[-1] == CODE_END_TOKEN_ID:
             snac_tokens = snac_tokens[:-1]
         
         frames = len(snac_tokens) // SNAC_TOKENS_PER_FRAME
-        snac_tokens = snac_tokens[:frames * SNAC_TOKENS_PER_FRAME]
         
         if frames == 0:
-            return [[], [], []]
-        
-        l1, l2, l3 = [], [], []
-        
-        for i in range(frames):
-            slots = snac_tokens[i*7:(i+1)*7]
-            l1.append((slots[0] - CODE_TOKEN_OFFSET) % 4096)
-            l2.extend([
-                (slots[1] - CODE_TOKEN_OFFSET) % 4096,
-                (slots[4] - CODE_TOKEN_OFFSET) % 4096,
-            ])
-            l3.extend([
-                (slots[2] - CODE_TOKEN_OFFSET) % 4096,
-                (slots[3] - CODE_TOKEN_OFFSET) % 4096,
-                (slots[5] - CODE_TOKEN_OFFSET) % 4096,
-                (slots[6] - CODE_TOKEN_OFFSET) % 4096,
-            ])
+            empty = np.empty(0, dtype=np.int64)
+            return [empty, empty, empty]
+        
+        codes = np.asarray(snac_tokens[:frames * SNAC_TOKENS_PER_FRAME], dtype=np.int64)
+        codes = codes.reshape(frames, SNAC_TOKENS_PER_FRAME)
+        
+        # One buffer holding the levels back to back (1 + 2 + 4 codes per frame),
+        # each level a contiguous view
+        buf = np.empty(frames * SNAC_TOKENS_PER_FRAME, dtype=np.int64)
+        l1 = buf[:frames]
+        l2 = buf[frames:3 * frames]
+        l3 = buf[3 * frames:]
+        np.take(codes, 0, axis=1, out=l1)
+        np.take(codes, [1, 4], axis=1, out=l2.reshape(frames, 2))
+        np.take(codes, [2, 3, 5, 6], axis=1, out=l3.reshape(frames, 4))
+        
+        # (token - offset) % 4096, as a bitmask since 4096 == 2**12
+        np.subtract(buf, CODE_TOKEN_OFFSET, out=buf)
+        np.bitwise_and(buf, 0xFFF, out=buf)
         
         return [l1, l2, l3]
     
@@ -157,47 +473,144 @@ class HollyVoiceGenerator:
         Returns:
             Audio waveform as numpy array (24kHz)
         """
-        if description is None:
-            description = HOLLY_VOICE_DESCRIPTION
+        audio = self.generate_batch(
+            [text],
+            [description],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p
+        )[0]
+        if isinstance(audio, Exception):
+            raise audio
+        return audio
+    
+    def generate_batch(
+        self,
+        texts: List[str],
+        descriptions: Optional[List[Optional[str]]] = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.4,
+        top_p: float = 0.9
+    ) -> List[Union[np.ndarray, Exception]]:
+        """
+        Generate HOLLY's voice for several texts in a single padded model.generate call
+        
+        Args:
+            texts: Texts to synthesize
+            descriptions: Voice description per text (None entries use HOLLY's signature voice)
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature (lower = more consistent)
+            top_p: Nucleus sampling threshold
+        
+        Returns:
+            Audio waveforms as numpy arrays (24kHz), in input order. A row whose
+            tokens cannot be decoded holds its exception instead of audio.
+        """
+        if descriptions is None:
+            descriptions = [None] * len(texts)
+        descriptions = [
+            HOLLY_VOICE_DESCRIPTION if description is None else description
+            for description in descriptions
+        ]
+        
+        audios: List[Optional[Union[np.ndarray, Exception]]] = [None] * len(texts)
+        cache_keys: List[Optional[str]] = [None] * len(texts)
         
         # Check cache first
         if self.enable_cache:
-            cache_key = self._get_cache_key(text, description, temperature, top_p)
-            cached_audio = self._load_from_cache(cache_key)
-            if cached_audio is not None:
-                print(f"⚡ Cache hit! Loading pre-generated audio")
-                return cached_audio
-        
-        print(f"🎤 Generating HOLLY's voice...")
-        print(f"   Text: {text[:100]}{'...' if len(text) > 100 else ''}")
+            for i, (text, description) in enumerate(zip(texts, descriptions)):
+                cache_keys[i] = self._get_cache_key(text, description, temperature, top_p)
+                cached_audio = self._load_from_cache(cache_keys[i])
+                if cached_audio is not None:
+                    print(f"⚡ Cache hit! Loading pre-generated audio")
+                    audios[i] = cached_audio
         
-        # Build prompt
-        prompt = self.build_prompt(description, text)
+        pending = [i for i, audio in enumerate(audios) if audio is None]
+        if not pending:
+            return audios
         
-        # Tokenize
-        inputs = self.tokenizer(prompt, return_tensors="pt")
-        if torch.cuda.is_available():
-            inputs = {k: v.to("cuda") for k, v in inputs.items()}
+        print(f"🎤 Generating HOLLY's voice (batch of {len(pending)})...")
+        for i in pending:
+            print(f"   Text: {texts[i][:100]}{'...' if len(texts[i]) > 100 else ''}")
         
         # Generate tokens
+        prompts = [self.encode_prompt(descriptions[i], texts[i]) for i in pending]
         print(f"   Generating tokens...")
-        with torch.inference_mode():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=max_tokens,
-                min_new_tokens=28,  # At least 4 SNAC frames
+        if self.compiled:
+            # Compiled graphs are specialized on batch size, so run rows one at a time
+            generated = []
+            for prompt in prompts:
+                generated += self._generate_tokens([prompt], max_tokens, temperature, top_p)
+        else:
+            generated = self._generate_tokens(prompts, max_tokens, temperature, top_p)
+        
+        for row, i in enumerate(pending):
+            generated_ids = generated[row]
+            print(f"   Generated {len(generated_ids)} tokens")
+            
+            try:
+                audio = self._decode_audio(generated_ids)
+            except ValueError as e:
+                # One bad row must not fail the rest of the batch
+                print(f"   ❌ {e}")
+                audios[i] = e
+                continue
+            
+            # Save to cache
+            if self.enable_cache:
+                self._save_to_cache(cache_keys[i], audio)
+            
+            duration_sec = len(audio) / 24000
+            print(f"   ✅ Audio generated: {len(audio)} samples ({duration_sec:.2f}s)")
+            audios[i] = audio
+        
+        return audios
+    
+    def _generate_tokens(
+        self,
+        prompts: List[List[int]],
+        max_tokens: int,
+        temperature: float,
+        top_p: float
+    ) -> List[np.ndarray]:
+        """Run Maya1 on a batch of prompts, returning the generated token ids for each"""
+        if self.backend == "vllm":
+            params = SamplingParams(
                 temperature=temperature,
                 top_p=top_p,
+                max_tokens=max_tokens,
+                min_tokens=28,  # At least 4 SNAC frames
                 repetition_penalty=1.1,
-                do_sample=True,
-                eos_token_id=CODE_END_TOKEN_ID,
-                pad_token_id=self.tokenizer.pad_token_id,
+                stop_token_ids=[CODE_END_TOKEN_ID],
             )
+            outputs = self._gpu_worker.submit(
+                self.engine.generate,
+                [{"prompt_token_ids": prompt} for prompt in prompts],
+                params,
+                use_tqdm=False
+            ).result()
+            return [np.asarray(output.outputs[0].token_ids, dtype=np.int64) for output in outputs]
         
-        # Extract generated tokens
-        generated_ids = outputs[0, inputs['input_ids'].shape[1]:].tolist()
-        print(f"   Generated {len(generated_ids)} tokens")
+        # Tokenize into a left-padded batch
+        inputs = self._prepare_inputs(prompts)
+        outputs = self._gpu_worker.submit(
+            self._model_generate,
+            inputs,
+            max_new_tokens=max_tokens,
+            min_new_tokens=28,  # At least 4 SNAC frames
+            temperature=temperature,
+            top_p=top_p,
+            repetition_penalty=1.1,
+            do_sample=True,
+            eos_token_id=CODE_END_TOKEN_ID,
+            pad_token_id=self.pad_token_id,
+        ).result()
         
+        # Strip the prompt
+        return list(outputs[:, inputs['input_ids'].shape[1]:].cpu().numpy())
+    
+    def _decode_audio(self, generated_ids: np.ndarray) -> np.ndarray:
+        """Decode generated Maya1 tokens to a SNAC waveform (warmup frame trimmed)"""
         # Extract SNAC codes
         snac_tokens = self.extract_snac_codes(generated_ids)
         print(f"   Extracted {len(snac_tokens)} SNAC tokens")
@@ -210,30 +623,269 @@ class HollyVoiceGenerator:
         frames = len(levels[0])
         print(f"   Unpacked {frames} frames")
         
-        # Convert to tensors
-        codes_tensor = [
-            torch.tensor(level, dtype=torch.long, device=self.device).unsqueeze(0)
-            for level in levels
-        ]
-        
-        # Decode to audio
+        # Decode to audio, trimming the warmup frame
         print(f"   Decoding to audio...")
-        with torch.inference_mode():
-            z_q = self.snac_model.quantizer.from_codes(codes_tensor)
-            audio = self.snac_model.decoder(z_q)[0, 0].cpu().numpy()
+        return self._decode_levels(levels, skip_frames=1 if frames > 1 else 0)
+    
+    def _decode_levels(
+        self,
+        levels: List[np.ndarray],
+        skip_frames: int = 0,
+        trim_frames: int = 0
+    ) -> np.ndarray:
+        """
+        Run the SNAC quantizer and decoder on unpacked code levels, dropping the
+        first skip_frames and last trim_frames frames of audio
+        """
+        frames = len(levels[0])
+        if self.decode_stream is None:
+            stream_context = autocast_context = contextlib.nullcontext()
+        else:
+            stream_context = torch.cuda.stream(self.decode_stream)
+            autocast_context = torch.autocast("cuda", dtype=torch.bfloat16)
+            
+            # Pad to a bucketed frame count (repeating the last frame) for static shapes
+            padded = _round_up_to_bucket(frames, SNAC_FRAME_BUCKETS)
+            levels = [
+                np.pad(level, (0, (padded - frames) * (len(level) // frames)), mode="edge")
+                for level in levels
+            ]
         
-        # Save to cache
+        with torch.inference_mode(), stream_context, autocast_context:
+            # Convert to tensors: one pinned host buffer, async H2D copies
+            codes = torch.from_numpy(np.concatenate(levels))
+            sizes = [len(level) for level in levels]
+            
+            snac_graph = None
+            if self.decode_stream is not None:
+                codes = codes.pin_memory()
+                snac_graph = self._snac_graphs.get(padded)
+            
+            if snac_graph is not None:
+                # Replay the captured decode for this bucket
+                graph, static_codes, audio = snac_graph
+                for static, level in zip(static_codes, torch.split(codes, sizes)):
+                    static.copy_(level.unsqueeze(0), non_blocking=True)
+                graph.replay()
+            else:
+                codes = codes.to(self.device, non_blocking=True)
+                audio = self._snac_forward([level.unsqueeze(0) for level in torch.split(codes, sizes)])
+            
+            # Slice on device so discarded samples never cross to the host
+            audio = audio[
+                0, 0,
+                skip_frames * SNAC_SAMPLES_PER_FRAME:(frames - trim_frames) * SNAC_SAMPLES_PER_FRAME
+            ]
+            if self._pinned_audio is not None and audio.numel() <= MAX_AUDIO_SAMPLES:
+                host = self._pinned_audio[:audio.numel()]
+                host.copy_(audio, non_blocking=True)
+                self.decode_stream.synchronize()
+                audio = host.float().numpy()  # .float() copies out of the reused pinned buffer
+            else:
+                audio = audio.float().cpu().numpy()
+        
+        return audio
+    
+    def _snac_forward(self, codes: List[torch.Tensor]) -> torch.Tensor:
+        """SNAC codes -> waveform tensor [1, 1, samples]"""
+        z_q = self.snac_model.quantizer.from_codes(codes)
+        return self.snac_model.decoder(z_q)
+    
+    def _capture_snac_graphs(self, warmup_runs: int = 3):
+        """
+        Capture one SNAC decode CUDA graph per frame bucket at startup
+        
+        Capturing lazily would race with other GPU work, so every bucket is
+        captured here before any request runs. Buckets that fail to capture
+        (and counts beyond the largest bucket) decode eagerly.
+        """
+        print(f"   📸 Capturing SNAC decode graphs ({len(SNAC_FRAME_BUCKETS)} buckets)...")
+        pool = torch.cuda.graph_pool_handle()
+        # Largest first, so smaller graphs fit in the memory the pool already holds
+        for frames in reversed(SNAC_FRAME_BUCKETS):
+            try:
+                with torch.inference_mode(), torch.autocast("cuda", dtype=torch.bfloat16):
+                    static_codes = [
+                        torch.zeros(1, frames * n, dtype=torch.long, device=self.device)
+                        for n in (1, 2, 4)
+                    ]
+                    # Several side-stream runs: TorchScript's profiling executor
+                    # re-optimizes after the first call, and capture must see the final plan
+                    self.decode_stream.wait_stream(torch.cuda.current_stream())
+                    with torch.cuda.stream(self.decode_stream):
+                        for _ in range(warmup_runs):
+                            self._snac_forward(static_codes)
+                    torch.cuda.current_stream().wait_stream(self.decode_stream)
+                    torch.cuda.synchronize()
+                    
+                    graph = torch.cuda.CUDAGraph()
+                    with torch.cuda.graph(graph, pool=pool):
+                        static_audio = self._snac_forward(static_codes)
+                self._snac_graphs[frames] = (graph, static_codes, static_audio)
+            except Exception as e:
+                print(f"⚠️  SNAC graph capture failed for {frames} frames, decoding eagerly: {e}")
+        print(f"   ✅ Captured {len(self._snac_graphs)} SNAC decode graphs")
+    
+    def generate_stream(
+        self,
+        text: str,
+        description: Optional[str] = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.4,
+        top_p: float = 0.9,
+        stop_event: Optional[threading.Event] = None
+    ) -> Iterator[np.ndarray]:
+        """
+        Generate HOLLY's voice from text, yielding audio chunks as frames are produced
+        
+        Args:
+            text: Text to synthesize
+            description: Voice description (defaults to HOLLY's signature voice)
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature (lower = more consistent)
+            top_p: Nucleus sampling threshold
+            stop_event: Set from any thread to stop generation early
+        
+        Yields:
+            Consecutive audio waveform chunks as numpy arrays (24kHz)
+        
+        Raises:
+            ValueError: If the model produced too few SNAC frames to decode
+        """
+        if description is None:
+            description = HOLLY_VOICE_DESCRIPTION
+        
+        # Check cache first
         if self.enable_cache:
-            self._save_to_cache(cache_key, audio)
+            cache_key = self._get_cache_key(text, description, temperature, top_p)
+            cached_audio = self._load_from_cache(cache_key)
+            if cached_audio is not None:
+                print(f"⚡ Cache hit! Loading pre-generated audio")
+                yield cached_audio
+                return
+        
+        print(f"🎤 Streaming HOLLY's voice...")
+        print(f"   Text: {text[:100]}{'...' if len(text) > 100 else ''}")
         
-        # Trim warmup samples
-        if len(audio) > 2048:
-            audio = audio[2048:]
+        token_stream = self._stream_tokens(
+            self.encode_prompt(description, text), max_tokens, temperature, top_p, stop_event
+        )
         
-        duration_sec = len(audio) / 24000
-        print(f"   ✅ Audio generated: {len(audio)} samples ({duration_sec:.2f}s)")
+        snac_tokens: List[int] = []
+        chunks: List[np.ndarray] = []
+        emitted = 1  # Frame 0 is decoder warmup, trimmed as in generate_batch
+        try:
+            for token_ids in token_stream:
+                finished = False
+                for token_id in token_ids:
+                    if token_id == CODE_END_TOKEN_ID:
+                        finished = True
+                        break
+                    if SNAC_MIN_ID <= token_id <= SNAC_MAX_ID:
+                        snac_tokens.append(token_id)
+                if finished:
+                    break
+                
+                frames = len(snac_tokens) // SNAC_TOKENS_PER_FRAME
+                ready = frames - STREAM_LOOKAHEAD_FRAMES
+                if ready - emitted >= STREAM_CHUNK_FRAMES:
+                    chunk = self._decode_window(snac_tokens, emitted, ready, frames)
+                    emitted = ready
+                    chunks.append(chunk)
+                    yield chunk
+            
+            if stop_event is not None and stop_event.is_set():
+                # Stopped early: the audio is incomplete, so neither flush nor cache it
+                print(f"   ⏹️  Stream stopped after {emitted} frames")
+                return
+            
+            # Flush remaining frames
+            frames = len(snac_tokens) // SNAC_TOKENS_PER_FRAME
+            if frames > emitted:
+                chunk = self._decode_window(snac_tokens, emitted, frames)
+                emitted = frames
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            token_stream.close()
         
-        return audio
+        if not chunks:
+            raise ValueError(f"Too few SNAC tokens to stream: {len(snac_tokens)}")
+        print(f"   ✅ Streamed {emitted} frames")
+        
+        # Save to cache
+        if self.enable_cache and chunks:
+            self._save_to_cache(cache_key, np.concatenate(chunks))
+    
+    def _stream_tokens(
+        self,
+        prompt: List[int],
+        max_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop_event: Optional[threading.Event] = None
+    ) -> Iterator[List[int]]:
+        """Yield generated token ids as Maya1 produces them (until stop_event is set)"""
+        if self.backend == "vllm":
+            # The offline vLLM engine returns whole sequences, so this yields once
+            yield self._generate_tokens([prompt], max_tokens, temperature, top_p)[0].tolist()
+            return
+        
+        inputs = self._prepare_inputs([prompt])
+        streamer = _TokenQueueStreamer()
+        stop = threading.Event() if stop_event is None else stop_event
+        
+        def run_generate():
+            try:
+                self._model_generate(
+                    inputs,
+                    max_new_tokens=max_tokens,
+                    min_new_tokens=28,  # At least 4 SNAC frames
+                    temperature=temperature,
+                    top_p=top_p,
+                    repetition_penalty=1.1,
+                    do_sample=True,
+                    eos_token_id=CODE_END_TOKEN_ID,
+                    pad_token_id=self.pad_token_id,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_StopEvent(stop)]),
+                )
+            except Exception as e:
+                streamer.error = e
+                streamer.end()
+        
+        # Tokens are fed back from the GPU worker thread through the streamer
+        job = self._gpu_worker.submit(run_generate)
+        try:
+            yield from streamer
+            if streamer.error is not None:
+                raise streamer.error
+        finally:
+            # Stops generation early if the consumer goes away
+            stop.set()
+            if not job.cancel():
+                job.result()
+    
+    def _decode_window(
+        self,
+        snac_tokens: List[int],
+        start: int,
+        end: int,
+        context_end: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Decode frames [start, end) with up to STREAM_CONTEXT_FRAMES frames of left
+        context and frames [end, context_end) as right context
+        """
+        first = max(0, start - STREAM_CONTEXT_FRAMES)
+        last = end if context_end is None else context_end
+        window = np.asarray(
+            snac_tokens[first * SNAC_TOKENS_PER_FRAME:last * SNAC_TOKENS_PER_FRAME],
+            dtype=np.int64
+        )
+        return self._decode_levels(
+            self.unpack_snac_from_7(window), skip_frames=start - first, trim_frames=last - end
+        )
     
     def save_audio(self, audio: np.ndarray, output_path: str):
         """Save audio to WAV file"""
@@ -241,49 +893,118 @@ class HollyVoiceGenerator:
         print(f"💾 Audio saved: {output_path}")
     
     def _get_cache_key(self, text: str, description: str, temperature: float, top_p: float) -> str:
-        """Generate cache key from generation parameters"""
+        """
+        Generate cache key from generation parameters
+        
+        Text and description are normalized (whitespace collapsed, casefolded), so
+        "Hello!" and " hello!  " intentionally share one cache entry.
+        """
+        text = " ".join(text.split()).casefold()
+        description = " ".join(description.split()).casefold()
         key_string = f"{text}|{description}|{temperature}|{top_p}"
-        return hashlib.md5(key_string.encode()).hexdigest()
+        return xxhash.xxh3_64_hexdigest(key_string.encode())
     
     def _load_from_cache(self, cache_key: str) -> Optional[np.ndarray]:
-        """Load audio from cache if available"""
-        cache_file = self.cache_dir / f"{cache_key}.npy"
-        if cache_file.exists():
+        """Load audio from cache if available (memory first, then disk)"""
+        with self._mem_cache_lock:
+            pcm = self._mem_cache.get(cache_key)
+            if pcm is not None:
+                self._mem_cache.move_to_end(cache_key)
+        
+        if pcm is None:
+            cache_file = self.cache_dir / f"{cache_key}.npy"
+            if not cache_file.exists():
+                return None
             try:
-                return np.load(cache_file)
+                pcm = np.load(cache_file)
             except Exception as e:
                 print(f"⚠️  Cache load failed: {e}")
                 return None
-        return None
+            self._remember(cache_key, pcm)
+        
+        return pcm.astype(np.float32) / 32767
     
     def _save_to_cache(self, cache_key: str, audio: np.ndarray):
         """Save audio to cache"""
         cache_file = self.cache_dir / f"{cache_key}.npy"
+        # int16 PCM halves the size versus float32, on disk and in memory
+        pcm = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+        self._remember(cache_key, pcm)
         try:
-            np.save(cache_file, audio)
+            previous_size = cache_file.stat().st_size if cache_file.exists() else None
+            np.save(cache_file, pcm)
+            size = cache_file.stat().st_size
+            with self._cache_stats_lock:
+                if previous_size is None:
+                    self._cache_count += 1
+                    self._cache_bytes += size
+                else:
+                    self._cache_bytes += size - previous_size
             print(f"🗄️  Cached audio for future use")
         except Exception as e:
             print(f"⚠️  Cache save failed: {e}")
     
+    def _remember(self, cache_key: str, pcm: np.ndarray):
+        """Insert int16 audio into the in-memory LRU, evicting the oldest entry"""
+        with self._mem_cache_lock:
+            self._mem_cache[cache_key] = pcm
+            self._mem_cache.move_to_end(cache_key)
+            while len(self._mem_cache) > MAX_MEM_CACHE:
+                self._mem_cache.popitem(last=False)
+    
     def clear_cache(self):
         """Clear all cached audio files"""
+        with self._mem_cache_lock:
+            self._mem_cache.clear()
         if self.cache_dir.exists():
             import shutil
             shutil.rmtree(self.cache_dir)
             self.cache_dir.mkdir(exist_ok=True)
+            with self._cache_stats_lock:
+                self._cache_count = 0
+                self._cache_bytes = 0
             print("🧹 Voice cache cleared")
     
+    def _scan_cache_dir(self, prune_legacy: bool = False) -> Tuple[int, int]:
+        """
+        Count cached files and their total bytes (one scandir pass)
+        
+        Entries from the old MD5-keyed float32 format can never be hit by an
+        xxh3 key, so they are never counted, and deleted when prune_legacy is set.
+        """
+        count = total_bytes = 0
+        if not self.cache_dir.exists():
+            return count, total_bytes
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not (entry.name.endswith(".npy") and entry.is_file(follow_symlinks=False)):
+                    continue
+                key = entry.name[:-len(".npy")]
+                if len(key) == LEGACY_CACHE_KEY_LENGTH and all(c in string.hexdigits for c in key):
+                    if prune_legacy:
+                        try:
+                            os.remove(entry.path)
+                        except OSError as e:
+                            print(f"⚠️  Failed to remove stale cache entry {entry.name}: {e}")
+                    continue
+                if len(key) != CACHE_KEY_LENGTH:
+                    continue
+                count += 1
+                total_bytes += entry.stat(follow_symlinks=False).st_size
+        return count, total_bytes
+    
     def get_cache_stats(self) -> dict:
         """Get cache statistics"""
         if not self.cache_dir.exists():
             return {"enabled": False}
         
-        cache_files = list(self.cache_dir.glob("*.npy"))
-        total_size_mb = sum(f.stat().st_size for f in cache_files) / (1024 * 1024)
+        with self._cache_stats_lock:
+            cached_phrases = self._cache_count
+            total_size_mb = self._cache_bytes / (1024 * 1024)
         
         return {
             "enabled": self.enable_cache,
-            "cached_phrases": len(cache_files),
+            "cached_phrases": cached_phrases,
             "total_size_mb": round(total_size_mb, 2),
             "cache_dir": str(self.cache_dir)
         }